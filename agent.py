@@ -5,145 +5,378 @@ A simple LangGraph agent that invokes an LLM with OpenTelemetry tracing to New R
 """
 
 import asyncio
+import functools
+import logging
 import os
+from dataclasses import dataclass, field
 from typing import Annotated
-from typing_extensions import TypedDict
+
+
+# Initialize New Relic on module load, before the framework imports below so
+# the agent's import hooks can instrument them
+from tracing import setup_newrelic, setup_otel_tracing, wait_for_newrelic
+
+_NR = setup_newrelic()
+NEW_RELIC_AVAILABLE = _NR is not None
+
+# Configure logging once; hot-path diagnostics use lazy %s formatting so the
+# message is never built when the level filters it out
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+logger = logging.getLogger(__name__)
+
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langchain_openai import ChatOpenAI
-
-# Initialize OpenTelemetry tracing to New Relic
-def setup_otel_tracing():
-    """
-    Configure OpenTelemetry to send traces to both LangSmith and New Relic via OTLP endpoint.
-    Uses LangSmith's OTEL integration for proper span attributes and kinds,
-    while also sending traces to New Relic.
-    
-    Environment variables required:
-    - OTEL_EXPORTER_OTLP_ENDPOINT: New Relic OTLP endpoint (default: https://otlp.nr-data.net)
-    - OTEL_EXPORTER_OTLP_HEADERS: API key header (format: "api-key=<license_key>")
-    - OTEL_SERVICE_NAME: Service name for tracing (optional)
-    
-    Also sets:
-    - LANGSMITH_OTEL_ENABLED=true: Enable LangSmith's OTEL integration for span attributes
+from langchain_core.messages import AIMessage
+
+# Initialize tracing on module load
+_TRACING_ENABLED = setup_otel_tracing()
+
+# Resolve the tracer once at import time; chatbot previously re-imported
+# opentelemetry and re-walked the provider registry on every invocation.
+# When setup returned False the SDK may be missing entirely, so the traced
+# node is never selected and _TRACER stays None without being consulted.
+if _TRACING_ENABLED:
+    from opentelemetry import trace as _otel_trace
+    _TRACER = _otel_trace.get_tracer(__name__)
+else:
+    _TRACER = None
+
+
+def setup_semantic_cache():
+    """
+    Configure an optional Redis-backed semantic cache for LLM responses.
+
+    Semantically similar prompts are answered from the cache in ~1-10ms instead
+    of paying a full LLM round trip. Caching is **optional** - it activates only
+    when SEMANTIC_CACHE_URL is set and the redisvl package is installed.
+
+    Environment variables:
+    - SEMANTIC_CACHE_URL: Redis URL for the cache (e.g. redis://localhost:6379)
+    - SEMANTIC_CACHE_DISTANCE_THRESHOLD: max vector distance for a hit (default: 0.1)
     """
+    redis_url = os.getenv("SEMANTIC_CACHE_URL")
+    if not redis_url:
+        print("ℹ️ SEMANTIC_CACHE_URL not set - semantic cache disabled")
+        return None
+
     try:
-        from opentelemetry import trace
-        from opentelemetry.sdk.trace import TracerProvider
-        from opentelemetry.sdk.trace.export import BatchSpanProcessor
-        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-        from opentelemetry.instrumentation.requests import RequestsInstrumentor
-        
-        # Set default environment variables for New Relic if not already configured
-        if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
-            os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = "https://otlp.nr-data.net"
-        
-        if not os.getenv("OTEL_SERVICE_NAME"):
-            os.environ["OTEL_SERVICE_NAME"] = "langgraph-newrelic-mre"
-        
-        # Enable LangSmith's OTEL integration for proper span attributes and kinds
-        os.environ["LANGSMITH_OTEL_ENABLED"] = "true"
-        
-        # Only initialize if OTLP headers (API key) are configured
-        if os.getenv("OTEL_EXPORTER_OTLP_HEADERS"):
-            # Create OTLP exporter with New Relic endpoint and headers
-            otlp_exporter = OTLPSpanExporter(
-                timeout=10,
-            )
-            
-            # Set up tracer provider with batch span processor
-            tracer_provider = TracerProvider()
-            tracer_provider.add_span_processor(
-                BatchSpanProcessor(otlp_exporter)
-            )
-            
-            # Set as global tracer provider
-            trace.set_tracer_provider(tracer_provider)
-            
-            # Enable automatic instrumentation for HTTP requests (captures LLM API calls)
-            RequestsInstrumentor().instrument()
-            
-            print("✅ OpenTelemetry tracing to New Relic initialized")
-            print("✅ LangSmith OTEL integration enabled for proper span attributes")
-            print("✅ Traces sent to both LangSmith and New Relic")
-            print("✅ HTTP instrumentation enabled (captures LLM API calls)")
-            return True
-        else:
-            print("ℹ️ OTEL_EXPORTER_OTLP_HEADERS not set - OTEL tracing disabled")
-            return False
+        from redisvl.extensions.llmcache import SemanticCache
+        from redisvl.utils.vectorize import HFTextVectorizer
+
+        cache = SemanticCache(
+            name="chatbot",
+            redis_url=redis_url,
+            distance_threshold=float(os.getenv("SEMANTIC_CACHE_DISTANCE_THRESHOLD", "0.1")),
+            vectorizer=HFTextVectorizer("redis/langcache-embed-v1"),
+        )
+        print("✅ Semantic cache initialized")
+        return cache
     except ImportError as e:
-        print(f"⚠️ OpenTelemetry packages not installed - tracing disabled: {e}")
-        return False
+        print(f"⚠️ redisvl not installed - semantic cache disabled: {e}")
+        return None
     except Exception as e:
-        print(f"⚠️ Failed to initialize OTEL tracing: {e}")
-        return False
+        print(f"⚠️ Failed to initialize semantic cache: {e}")
+        return None
 
-# Initialize tracing on module load
-setup_otel_tracing()
+
+# Initialize the semantic cache on module load
+semantic_cache = setup_semantic_cache()
+
+
+# Shared LLM client - memoized so the first invocation constructs it and every
+# later one reuses the same httpx connection pool (keep-alive TLS) instead of
+# paying client construction and a fresh TCP/TLS handshake per graph step. The
+# client is never mutated, so sharing it across threads is safe; use
+# _get_llm().bind(...) for per-request overrides.
+_LLM = None
+_LLM_FAILED = False
+
+
+def _get_llm():
+    """Memoized ChatOpenAI client; None when construction has failed."""
+    global _LLM, _LLM_FAILED
+    if _LLM is None and not _LLM_FAILED:
+        try:
+            # Deferred: importing langchain_openai drags in pydantic models,
+            # tiktoken, and the openai SDK - tens to hundreds of ms that
+            # echo-mode deployments and cold starts should not pay up front
+            from langchain_openai import ChatOpenAI
+
+            _LLM = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+        except Exception as e:
+            logger.warning("Failed to construct ChatOpenAI client: %s", e)
+            _LLM_FAILED = True
+    return _LLM
 
 
-class State(TypedDict):
-    """Simple state for our agent."""
-    messages: Annotated[list, add_messages]
+# Optional micro-batching of concurrent LLM invocations. Off by default;
+# single-request deployments gain nothing from the extra queue hop.
+_BATCHING_ENABLED = os.getenv("CHATBOT_BATCHING_ENABLED", "").lower() in ("1", "true", "yes")
+_BATCH_MAX_SIZE = int(os.getenv("CHATBOT_BATCH_MAX_SIZE", "32"))
+_BATCH_WAIT_TIMEOUT_S = float(os.getenv("CHATBOT_BATCH_WAIT_TIMEOUT_S", "0.002"))
 
 
-def chatbot(state: State):
+class _LLMBatcher:
     """
-    Simple chatbot node that calls an LLM.
-    Traces execution to OpenTelemetry/New Relic.
+    Coalesces concurrent LLM invocations into single llm.abatch calls.
+
+    Callers enqueue their message list and await a future; a background task
+    drains up to _BATCH_MAX_SIZE entries (waiting _BATCH_WAIT_TIMEOUT_S for
+    stragglers), issues one abatch round trip, and resolves each caller's
+    future - amortizing per-request RPC overhead across the batch window.
+    """
+
+    def __init__(self, get_llm, max_batch_size, wait_timeout_s):
+        self._get_llm = get_llm
+        self._max_batch_size = max_batch_size
+        self._wait_timeout_s = wait_timeout_s
+        # Created lazily so the queue and worker bind to the server's loop
+        self._queue = None
+        self._worker = None
+
+    async def invoke(self, messages):
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._drain())
+        future = loop.create_future()
+        await self._queue.put((messages, future))
+        return await future
+
+    async def _drain(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._max_batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), self._wait_timeout_s))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                responses = await self._get_llm().abatch([messages for messages, _ in batch])
+                for (_, future), response in zip(batch, responses):
+                    if not future.done():
+                        future.set_result(response)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+@dataclass(slots=True)
+class State:
+    """
+    Agent state as a slotted dataclass: state.messages resolves through a
+    C-level slot descriptor instead of hashing a dict key on every read in
+    the hot node.
+    """
+    messages: Annotated[list, add_messages] = field(default_factory=list)
+
+
+# Template for the echo fallback: copying a prebuilt dict is one C-level
+# call, where a dict literal re-hashes and re-inserts both keys per response
+_ASSISTANT_TEMPLATE = {"role": "assistant", "content": None}
+
+
+def _chatbot_body(messages, prompt, span=None):
+    """
+    Shared chatbot body: semantic cache check, LLM call, echo fallback.
+    Span attributes are set only when a recording span is supplied.
     """
-    messages = state["messages"]
-    
-    # Get tracer for this module
-    tracer = None
-    try:
-        from opentelemetry import trace
-        tracer = trace.get_tracer(__name__)
-    except ImportError:
-        pass
-    
-    # Create a span for this operation
-    span_context = tracer.start_as_current_span("chatbot_invoke") if tracer else None
-    
     try:
-        llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+        # Serve semantically similar prompts from the cache without calling the LLM
+        if semantic_cache is not None:
+            try:
+                hit = semantic_cache.check(prompt=prompt, num_results=1)
+                if hit:
+                    return {"messages": [AIMessage(content=hit[0]["response"])]}
+            except Exception as e:
+                logger.warning("Semantic cache check failed: %s", e)
+
+        llm = _get_llm()
+        if llm is None:
+            raise RuntimeError("ChatOpenAI client unavailable")
         response = llm.invoke(messages)
-        
-        if tracer and span_context:
-            span_context.__enter__().set_attribute("llm.response.success", True)
-        
+
+        if semantic_cache is not None:
+            try:
+                semantic_cache.store(prompt=prompt, response=response.content)
+            except Exception as e:
+                logger.warning("Semantic cache store failed: %s", e)
+
+        if span is not None:
+            span.set_attribute("llm.response.success", True)
+
+        return {"messages": [response]}
+    except Exception as e:
+        if span is not None:
+            span.set_attribute("llm.response.error", str(e))
+
+        logger.warning("LLM error: %s", e)
+        # Echo mode fallback
+        echo_response = _ASSISTANT_TEMPLATE.copy()
+        echo_response["content"] = f"Echo: {prompt}"
+        return {"messages": [echo_response]}
+
+
+def _chatbot_traced(state: State):
+    """
+    Chatbot node wrapped in a chatbot_invoke span.
+    Traces execution to OpenTelemetry/New Relic.
+    """
+    messages = state.messages
+
+    # Prompt used as the semantic cache key (last user message)
+    last_message = messages[-1]
+    content = getattr(last_message, 'content', None)
+    prompt = content if content is not None else str(last_message)
+
+    # Exactly one span per invocation, entered and exited by the context manager
+    with _TRACER.start_as_current_span("chatbot_invoke") as span:
+        return _chatbot_body(messages, prompt, span)
+
+
+def _chatbot_plain(state: State):
+    """
+    Chatbot node without tracing. Even NoOp spans allocate attribute dicts
+    per call, so the untraced deployment skips span machinery entirely.
+    """
+    messages = state.messages
+
+    # Prompt used as the semantic cache key (last user message)
+    last_message = messages[-1]
+    content = getattr(last_message, 'content', None)
+    prompt = content if content is not None else str(last_message)
+
+    return _chatbot_body(messages, prompt)
+
+
+async def _chatbot_batched(state: State):
+    """
+    Async chatbot node that funnels concurrent invocations through the
+    micro-batcher. The semantic cache is bypassed here: its Redis client is
+    synchronous and would block the event loop.
+    """
+    messages = state.messages
+
+    last_message = messages[-1]
+    content = getattr(last_message, 'content', None)
+    prompt = content if content is not None else str(last_message)
+
+    try:
+        if _get_llm() is None:
+            raise RuntimeError("ChatOpenAI client unavailable")
+        response = await _BATCHER.invoke(messages)
         return {"messages": [response]}
     except Exception as e:
-        if tracer and span_context:
-            span_context.__enter__().set_attribute("llm.response.error", str(e))
-        
-        print(f"⚠️ LLM error: {e}")
+        logger.warning("LLM error: %s", e)
         # Echo mode fallback
-        last_message = messages[-1]
-        echo_response = {
-            "role": "assistant",
-            "content": f"Echo: {last_message.content if hasattr(last_message, 'content') else str(last_message)}"
-        }
+        echo_response = _ASSISTANT_TEMPLATE.copy()
+        echo_response["content"] = f"Echo: {prompt}"
         return {"messages": [echo_response]}
-    finally:
-        if span_context:
-            span_context.__exit__(None, None, None)
 
 
-# Build the graph
-print("🔨 Building LangGraph...")
-graph_builder = StateGraph(State)
-graph_builder.add_node("chatbot", chatbot)
-graph_builder.add_edge(START, "chatbot")
-graph_builder.add_edge("chatbot", END)
+# Bind the node once at import: deployments without OTEL configured never
+# touch the span machinery, and batching is opt-in via env flag
+if _BATCHING_ENABLED:
+    _BATCHER = _LLMBatcher(_get_llm, _BATCH_MAX_SIZE, _BATCH_WAIT_TIMEOUT_S)
+    chatbot = _chatbot_batched
+else:
+    chatbot = _chatbot_traced if _TRACING_ENABLED else _chatbot_plain
+
+
+# Build and compile the graph. Compilation is CPU-bound and memoized: under
+# reloaders or repeated imports the compiled graph is reused instead of
+# re-running LangGraph's planner.
+@functools.cache
+def _build_graph():
+    print("🔨 Building LangGraph...")
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("chatbot", chatbot)
+    graph_builder.add_edge(START, "chatbot")
+    graph_builder.add_edge("chatbot", END)
+    # Explicit compile options: no checkpointer and debug off, so the Pregel
+    # runner never accumulates per-step debug records for this graph
+    return graph_builder.compile(checkpointer=None, debug=False)
+
+
+_base_graph = _build_graph()
+
+
+def _make_entry_point(name):
+    """
+    Build an InstrumentedGraph entry point with the transaction name and
+    target attribute baked into the closure, instead of four hand-written
+    methods repeating the same naming sequence per call.
+
+    The wrapper is deliberately synchronous even for the async entry points:
+    the underlying coroutine / async iterator is returned as-is, so callers
+    await or iterate the original object without an extra wrapper frame per
+    call (or per chunk, for the streaming paths).
+    """
+    txn_name = f"LangGraph/agent/{name}"
+    target = "_" + name
+
+    def wrapper(self, *args, **kwargs):
+        # Called unconditionally: set_transaction_name itself returns early
+        # when no transaction is active, so guarding it here would just look
+        # up the transaction twice on the common instrumented path
+        self._set_txn(txn_name, group="Function")
+        return getattr(self, target)(*args, **kwargs)
+
+    wrapper.__name__ = name
+    wrapper.__qualname__ = f"InstrumentedGraph.{name}"
+    return wrapper
+
+
+class InstrumentedGraph:
+    """
+    Wrapper around the compiled graph that names New Relic transactions.
+
+    Each entry point sets the transaction name so requests group under
+    LangGraph/agent/* in APM instead of the generic ASGI transaction.
+    Everything else delegates to the underlying graph; attributes resolved
+    through __getattr__ are cached on the instance so only the first access
+    pays the fallback lookup.
+    """
+
+    def __init__(self, compiled_graph):
+        self._graph = compiled_graph
+        # Pre-bound so each entry point reaches these through one instance
+        # attribute instead of a module global plus attribute walk
+        self._set_txn = _NR.set_transaction_name
+        # Apply FunctionTrace decoration once at construction. Building the
+        # decorator per call (function_trace(...)(fn)(...)) would allocate a
+        # fresh decorator and wrapped callable on every request. The wrapper
+        # is only constructed when New Relic is active, so no guard is needed.
+        self._invoke = _NR.function_trace(name="LangGraph/agent/invoke", group="Function")(compiled_graph.invoke)
+        self._ainvoke = _NR.function_trace(name="LangGraph/agent/ainvoke", group="Function")(compiled_graph.ainvoke)
+        self._stream = _NR.function_trace(name="LangGraph/agent/stream", group="Function")(compiled_graph.stream)
+        self._astream = _NR.function_trace(name="LangGraph/agent/astream", group="Function")(compiled_graph.astream)
+
+    invoke = _make_entry_point("invoke")
+    ainvoke = _make_entry_point("ainvoke")
+    stream = _make_entry_point("stream")
+    astream = _make_entry_point("astream")
+
+    def __getattr__(self, name):
+        attr = getattr(self._graph, name)
+        # Bind the resolved attribute so subsequent accesses hit __dict__
+        # directly instead of re-entering __getattr__
+        object.__setattr__(self, name, attr)
+        return attr
 
-# Compile the graph
-async def compile_graph():
-    def _compile():
-        return graph_builder.compile()
-    return await asyncio.to_thread(_compile)
 
-graph = asyncio.run(compile_graph())
+# Wrap the graph so New Relic transactions are named per entry point. When
+# New Relic is not configured, expose the compiled graph directly so no call
+# ever pays the wrapper's delegation overhead.
+if NEW_RELIC_AVAILABLE:
+    # Agent bootstrap ran on a background thread, overlapped with the imports
+    # above; rejoin it before the first instrumented request can arrive
+    wait_for_newrelic()
+    graph = InstrumentedGraph(_base_graph)
+else:
+    graph = _base_graph
 
 print("✅ LangGraph compiled successfully")
 print("🚀 Ready to deploy!")
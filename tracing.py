@@ -0,0 +1,264 @@
+"""
+Observability setup for the LangGraph agent.
+
+Tracing-backend selection lives here so the agent module keeps a single
+import graph: New Relic APM is gated by NEW_RELIC_LICENSE_KEY and
+OpenTelemetry tracing to New Relic/LangSmith is gated by
+OTEL_EXPORTER_OTLP_HEADERS. Importing this module has no side effects;
+call setup_newrelic() and setup_otel_tracing() explicitly.
+"""
+
+import os
+import sys
+import threading
+
+# Set once New Relic initialization has finished (or was skipped); consumers
+# that need the initialized agent wait on this via wait_for_newrelic()
+_NR_READY = threading.Event()
+
+# Hook diagnostics are opt-in and evaluated once at import, so the delegation
+# path never formats a message or takes the stdio lock under load
+_HOOK_DEBUG = bool(os.environ.get("NR_HOOK_DEBUG"))
+
+
+# Sentinel distinguishing "attribute absent" from a legitimate None value
+_MISSING = object()
+
+
+# Shared no-op returned for hook attributes that cannot be resolved, so
+# callers always get something callable without a fresh lambda per lookup
+def _noop(*args, **kwargs):
+    return None
+
+
+class ResilientUvicornHook:
+    """
+    Safely handles New Relic's Uvicorn hook with lazy loading.
+
+    LangGraph Platform controls the Uvicorn lifecycle, and New Relic's
+    adapter_uvicorn hook touches Config._nr_loaded_app before the config is
+    fully loaded. Installing this proxy in sys.modules before New Relic
+    initializes defers loading the real hook until it is safe, while keeping
+    full instrumentation once it loads.
+    """
+
+    def __init__(self):
+        self._real_hook = None
+        self._hook_loaded = False
+
+    def _load_real_hook(self):
+        if not self._hook_loaded:
+            try:
+                # The proxy occupies sys.modules, so drop it first to let the
+                # real module import. The real module then stays installed:
+                # every later import binds straight to it and never pays
+                # proxy dispatch again
+                sys.modules.pop('newrelic.hooks.adapter_uvicorn', None)
+                import newrelic.hooks.adapter_uvicorn
+                self._real_hook = newrelic.hooks.adapter_uvicorn
+            except ImportError as e:
+                # Only a missing module is expected here; an AttributeError
+                # would mean a real bug in the New Relic hook and should
+                # propagate instead of silently disabling instrumentation
+                if _HOOK_DEBUG:
+                    sys.stderr.write(f"ResilientUvicornHook: hook load failed: {e}\n")
+                # Reinstall the proxy so later imports keep their safe no-ops
+                sys.modules['newrelic.hooks.adapter_uvicorn'] = self
+            self._hook_loaded = True
+            # One-shot: after the first attempt, rebind to a no-op so later
+            # calls skip the flag check and try/except entirely
+            self._load_real_hook = _noop
+
+    def __getattr__(self, name):
+        self._load_real_hook()
+        # Single getattr with a sentinel instead of hasattr + getattr, which
+        # resolved the attribute twice (and paid exception setup on misses)
+        attr = getattr(self._real_hook, name, _MISSING) if self._real_hook else _MISSING
+        if attr is not _MISSING:
+            # Cache on the instance so repeat lookups hit __dict__ directly
+            # instead of falling back into __getattr__ every time
+            object.__setattr__(self, name, attr)
+            return attr
+        if _HOOK_DEBUG:
+            sys.stderr.write(f"ResilientUvicornHook: no-op for {name!r}\n")
+        # Bind the shared no-op under this name too: unresolvable attributes
+        # are just as hot, and caching lets later lookups bypass __getattr__
+        object.__setattr__(self, name, _noop)
+        return _noop
+
+
+def wait_for_newrelic(timeout=10.0):
+    """
+    Block until the background New Relic initialization has finished.
+    Returns immediately when initialization was skipped or already completed.
+    """
+    _NR_READY.wait(timeout)
+
+
+def setup_newrelic():
+    """
+    Initialize the New Relic agent if a license key is configured.
+
+    Installs the resilient Uvicorn hook proxy before initialization so the
+    agent's hook cannot fire against LangGraph Platform's Uvicorn config too
+    early. newrelic.agent.initialize() runs on a background thread - the
+    config stat, newrelic.ini parse, and agent bootstrap (100-300ms on
+    containerized overlayfs starts) overlap with the framework imports that
+    follow. Call wait_for_newrelic() before serving instrumented traffic.
+
+    Environment variables:
+    - NEW_RELIC_LICENSE_KEY: enables monitoring when set
+    - NEW_RELIC_CONFIG_FILE: agent config path (default: local newrelic.ini)
+    """
+    if not os.getenv("NEW_RELIC_LICENSE_KEY"):
+        print("ℹ️ NEW_RELIC_LICENSE_KEY not set - New Relic monitoring disabled")
+        _NR_READY.set()
+        return None
+
+    # Idempotency sentinel kept on sys: if the agent module gets imported
+    # twice (script + import, reloaders, test collection) the second pass must
+    # not re-initialize the agent or re-parse newrelic.ini. A module-level
+    # flag would not survive the module being duplicated under another name.
+    agent_module = getattr(sys, "_nr_agent_module", None)
+    if agent_module is not None:
+        _NR_READY.set()
+        return agent_module
+
+    try:
+        # Intercept the Uvicorn hook before New Relic can import it
+        sys.modules['newrelic.hooks.adapter_uvicorn'] = ResilientUvicornHook()
+
+        import newrelic.agent
+
+        config_file = os.getenv("NEW_RELIC_CONFIG_FILE")
+        if not config_file:
+            local_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "newrelic.ini")
+            config_file = local_config if os.path.exists(local_config) else None
+
+        def _initialize():
+            try:
+                newrelic.agent.initialize(config_file)
+                sys._nr_agent_module = newrelic.agent
+                # Initialization is done, so the import-ordering hazard the
+                # proxy guards against is over: swap in the real hook module
+                # eagerly. Uvicorn instrumentation then binds straight to it
+                # and never pays proxy dispatch; if the import still fails,
+                # the proxy stays installed and keeps serving safe no-ops.
+                try:
+                    sys.modules.pop('newrelic.hooks.adapter_uvicorn', None)
+                    import newrelic.hooks.adapter_uvicorn as _real_hook
+                    sys.modules['newrelic.hooks.adapter_uvicorn'] = _real_hook
+                except ImportError as e:
+                    sys.modules['newrelic.hooks.adapter_uvicorn'] = ResilientUvicornHook()
+                    if _HOOK_DEBUG:
+                        sys.stderr.write(f"setup_newrelic: eager hook load failed: {e}\n")
+                print("✅ New Relic agent initialized")
+            except Exception as e:
+                print(f"⚠️ Failed to initialize New Relic: {e}")
+            finally:
+                _NR_READY.set()
+
+        threading.Thread(target=_initialize, name="newrelic-init", daemon=True).start()
+        return newrelic.agent
+    except ImportError as e:
+        print(f"⚠️ newrelic package not installed - monitoring disabled: {e}")
+        _NR_READY.set()
+        return None
+
+
+def setup_otel_tracing():
+    """
+    Configure OpenTelemetry to send traces to both LangSmith and New Relic via OTLP endpoint.
+    Uses LangSmith's OTEL integration for proper span attributes and kinds,
+    while also sending traces to New Relic.
+
+    Environment variables required:
+    - OTEL_EXPORTER_OTLP_ENDPOINT: New Relic OTLP endpoint (default: https://otlp.nr-data.net)
+    - OTEL_EXPORTER_OTLP_HEADERS: API key header (format: "api-key=<license_key>")
+    - OTEL_SERVICE_NAME: Service name for tracing (optional)
+
+    Also sets:
+    - LANGSMITH_OTEL_ENABLED=true: Enable LangSmith's OTEL integration for span attributes
+    """
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.instrumentation.requests import RequestsInstrumentor
+
+        # Prefer the gRPC exporter: it reuses a single persistent HTTP/2
+        # channel and multiplexes exports instead of issuing a fresh HTTP/1.1
+        # POST per flush. New Relic accepts OTLP/gRPC at otlp.nr-data.net:4317.
+        # Fall back to HTTP/protobuf if the gRPC exporter is unavailable.
+        try:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            exporter_protocol = "grpc"
+        except ImportError:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter_protocol = "http/protobuf"
+
+        # Set default environment variables for New Relic if not already configured
+        if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = "https://otlp.nr-data.net"
+
+        if not os.getenv("OTEL_SERVICE_NAME"):
+            os.environ["OTEL_SERVICE_NAME"] = "langgraph-newrelic-mre"
+
+        # Enable LangSmith's OTEL integration for proper span attributes and kinds
+        os.environ["LANGSMITH_OTEL_ENABLED"] = "true"
+
+        # Only initialize if OTLP headers (API key) are configured
+        if os.getenv("OTEL_EXPORTER_OTLP_HEADERS"):
+            # Create OTLP exporter with New Relic endpoint and headers.
+            # Span payloads are highly compressible (repeated attribute keys),
+            # so gzip cuts bytes on the wire several-fold; New Relic's OTLP
+            # endpoint accepts gzip on both protocols.
+            if exporter_protocol == "grpc":
+                import grpc
+                otlp_exporter = OTLPSpanExporter(
+                    insecure=False,
+                    timeout=10,
+                    compression=grpc.Compression.Gzip,
+                )
+            else:
+                from opentelemetry.exporter.otlp.proto.http import Compression
+                otlp_exporter = OTLPSpanExporter(
+                    timeout=10,
+                    compression=Compression.Gzip,
+                )
+
+            # Set up tracer provider with batch span processor.
+            # The library defaults (queue=2048, delay=5000ms, batch=512,
+            # timeout=30000ms) drop spans under bursts; tune for the agent's
+            # burst profile and let ops retune via env vars without redeploy.
+            tracer_provider = TracerProvider()
+            tracer_provider.add_span_processor(
+                BatchSpanProcessor(
+                    otlp_exporter,
+                    max_queue_size=int(os.getenv("OTEL_BSP_MAX_QUEUE_SIZE", "4096")),
+                    schedule_delay_millis=int(os.getenv("OTEL_BSP_SCHEDULE_DELAY", "1000")),
+                    max_export_batch_size=int(os.getenv("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "256")),
+                    export_timeout_millis=int(os.getenv("OTEL_BSP_EXPORT_TIMEOUT", "10000")),
+                )
+            )
+
+            # Set as global tracer provider
+            trace.set_tracer_provider(tracer_provider)
+
+            # Enable automatic instrumentation for HTTP requests (captures LLM API calls)
+            RequestsInstrumentor().instrument()
+
+            print(f"✅ OpenTelemetry tracing to New Relic initialized (OTLP/{exporter_protocol})")
+            print("✅ LangSmith OTEL integration enabled for proper span attributes")
+            print("✅ Traces sent to both LangSmith and New Relic")
+            print("✅ HTTP instrumentation enabled (captures LLM API calls)")
+            return True
+        else:
+            print("ℹ️ OTEL_EXPORTER_OTLP_HEADERS not set - OTEL tracing disabled")
+            return False
+    except ImportError as e:
+        print(f"⚠️ OpenTelemetry packages not installed - tracing disabled: {e}")
+        return False
+    except Exception as e:
+        print(f"⚠️ Failed to initialize OTEL tracing: {e}")
+        return False